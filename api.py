@@ -1,11 +1,13 @@
 import os
 import json
+import shutil
 import time
 from pathlib import Path
 from typing import List, Dict, Any, Optional
 
 import numpy as np
 from fastapi import FastAPI, File, UploadFile, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -14,8 +16,8 @@ from PIL import Image
 
 # Reuse your MVP pieces
 from mvp_reco import (
-    ClipEncoder, load_catalog, detect_instances, cos_sim, draw_and_save,
-    YOLO, DEVICE, get_db, load_catalog_from_db, save_embeddings_to_db
+    ClipEncoder, load_catalog, detect_instances, draw_and_save, build_index, rank_catalog,
+    YOLO, DEVICE, get_db, load_catalog_from_db, save_embeddings_to_db, decode_embeddings
 )
 
 # ---------------------------
@@ -27,6 +29,15 @@ RUNS_DIR = Path(os.getenv("RUNS_DIR", "runs"))
 STATIC_DIR = Path(os.getenv("STATIC_DIR", "catalog"))
 TOPK_DEFAULT = int(os.getenv("TOPK", "3"))
 ALPHA_IMG_DEFAULT = float(os.getenv("ALPHA_IMG", "0.7"))  # image vs text weight
+# On-disk precision of the embedding cache; ranking always runs in float32
+# because NumPy has no BLAS-backed float16 GEMM on CPU. The float32 default is
+# memory-mapped as-is (zero-copy, pages shared across uvicorn workers); float16
+# halves the file but is upcast into a private float32 copy at load time.
+EMB_CACHE_DTYPE = np.dtype(os.getenv("EMB_CACHE_DTYPE", "float32"))
+# Opt-in FAISS ranking. The index is an exact IndexFlatIP over [img | txt], so it does
+# the same brute-force work as the NumPy GEMM while holding a second float32 copy of
+# both banks; off by default to keep catalog RAM (and mmap page sharing) intact.
+USE_FAISS = os.getenv("USE_FAISS", "0") == "1"
 
 EMB_DIR.mkdir(parents=True, exist_ok=True)
 (RUNS_DIR / "uploads").mkdir(parents=True, exist_ok=True)
@@ -36,10 +47,12 @@ EMB_DIR.mkdir(parents=True, exist_ok=True)
 # ---------------------------
 app = FastAPI(title="Pic2Product API", version="1.0.0")
 
+# Wildcard origins + credentials is rejected by browsers anyway and makes the
+# middleware echo each request's Origin; the frontend never sends cookies.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
-    allow_credentials=True,
+    allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
 )
@@ -55,8 +68,9 @@ else:
             app.mount("/static", StaticFiles(directory=str(p)), name="static")
             break
 
-# Serve uploads/visualizations at /runs
-app.mount("/runs", StaticFiles(directory=str(RUNS_DIR)), name="runs")
+# Serve uploads/visualizations at /runs (directory is created above, skip the check)
+# In production, prefer serving /static and /runs straight from nginx/Caddy.
+app.mount("/runs", StaticFiles(directory=str(RUNS_DIR), check_dir=False), name="runs")
 
 
 # ---------------------------
@@ -69,6 +83,7 @@ class State:
     img_embs: Optional[np.ndarray] = None
     txt_embs: Optional[np.ndarray] = None
     embedding_dim: Optional[int] = None
+    index = None  # optional FAISS index over [img | txt] rows
     catalog_path: Path = CATALOG_CSV
 
 state = State()
@@ -93,9 +108,21 @@ class RecommendResponse(BaseModel):
 # ---------------------------
 # Cache helpers
 # ---------------------------
+def _save_bank(path: Path, embs: np.ndarray):
+    # Write-then-rename so workers still mapping the old file keep a valid inode
+    tmp = path.with_suffix(".tmp.npy")
+    np.save(tmp, np.ascontiguousarray(embs, dtype=EMB_CACHE_DTYPE))
+    os.replace(tmp, path)
+
+def _load_bank(path: Path) -> np.ndarray:
+    # Raw .npy (not .npz) so it can be memory-mapped; upcast only if stored narrower
+    embs = np.load(path, mmap_mode="r")
+    return embs if embs.dtype == np.float32 else np.asarray(embs, dtype=np.float32)
+
 def _save_cache(rows, img_embs, txt_embs):
     EMB_DIR.mkdir(parents=True, exist_ok=True)
-    np.savez(EMB_DIR / "catalog_embeddings.npz", img_embs=img_embs, txt_embs=txt_embs)
+    _save_bank(EMB_DIR / "img_embs.npy", img_embs)
+    _save_bank(EMB_DIR / "txt_embs.npy", txt_embs)
     idx = {
         "embedding_dim": int(img_embs.shape[1]),
         "ids": [r["sku_id"] for r in rows],
@@ -106,16 +133,16 @@ def _save_cache(rows, img_embs, txt_embs):
         json.dump(idx, f, ensure_ascii=False, indent=2)
 
 def _try_load_cache():
-    npz_path = EMB_DIR / "catalog_embeddings.npz"
+    img_path = EMB_DIR / "img_embs.npy"
+    txt_path = EMB_DIR / "txt_embs.npy"
     idx_path = EMB_DIR / "catalog_index.json"
-    if not (npz_path.exists() and idx_path.exists()):
+    if not (img_path.exists() and txt_path.exists() and idx_path.exists()):
         return False
     try:
-        npz = np.load(npz_path)
         with open(idx_path, "r", encoding="utf-8") as f:
             idx = json.load(f)
-        state.img_embs = np.array(npz["img_embs"])
-        state.txt_embs = np.array(npz["txt_embs"])
+        state.img_embs = _load_bank(img_path)
+        state.txt_embs = _load_bank(txt_path)
         state.catalog_rows = idx["rows"]
         state.embedding_dim = int(idx.get("embedding_dim", state.img_embs.shape[1]))
         return True
@@ -137,33 +164,36 @@ def _try_load_from_db() -> bool:
         if not rows:
             return False
 
-        catalog_rows = []
-        embs = []
-        dim = rows[0]["dim"]
-
-        for r in rows:
-            catalog_rows.append({
+        catalog_rows = [
+            {
                 "sku_id": r["sku_id"],
                 "title": r["title"],
                 "brand": r["brand"],
                 "image_path": r["image_path"],
-            })
-            v = np.frombuffer(r["embedding"], dtype="float32").reshape(dim)
-            embs.append(v)
+            }
+            for r in rows
+        ]
 
         state.catalog_rows = catalog_rows
-        state.img_embs = np.stack(embs, axis=0)
-        state.embedding_dim = dim
-        # if you also store text embeddings, load similarly
+        state.img_embs = decode_embeddings(rows)
+        # The DB only stores image embeddings; drop any text bank left over from an
+        # earlier cache load/rebuild so it can't be paired with a different row count
+        state.txt_embs = None
+        state.embedding_dim = int(state.img_embs.shape[1])
         return True
     except Exception as e:
         print(f"[WARN] failed to load embeddings from DB: {e}")
         return False
 
 
+def _refresh_index():
+    state.index = build_index(state.img_embs, state.txt_embs) if USE_FAISS else None
+
+
 def _build_catalog(clip: ClipEncoder, csv_path: Path, force: bool = False):
     # Try DB first
     if not force and _try_load_from_db():
+        _refresh_index()
         return {
             "status": "loaded_from_db",
             "catalog_size": len(state.catalog_rows),
@@ -173,6 +203,7 @@ def _build_catalog(clip: ClipEncoder, csv_path: Path, force: bool = False):
     
     # Then try cache
     if not force and _try_load_cache():
+        _refresh_index()
         return {
             "status": "loaded_from_cache",
             "catalog_size": len(state.catalog_rows),
@@ -186,6 +217,7 @@ def _build_catalog(clip: ClipEncoder, csv_path: Path, force: bool = False):
     state.img_embs = catalog["img_embs"]
     state.txt_embs = catalog["txt_embs"]
     state.embedding_dim = int(state.img_embs.shape[1])
+    _refresh_index()
 
     # NEW: Save to DB
     try:
@@ -197,7 +229,7 @@ def _build_catalog(clip: ClipEncoder, csv_path: Path, force: bool = False):
         db_msg = f"WARNING: failed to save embeddings to DB: {e}"
         print("[WARN]", db_msg)
 
-    # Optionally still keep .npz cache as secondary
+    # Optionally still keep .npy cache as secondary
     _save_cache(state.catalog_rows, state.img_embs, state.txt_embs)
     return {
         "status": "success",
@@ -276,34 +308,34 @@ async def recommend(
     stamp = int(time.time() * 1000)
     img_path = RUNS_DIR / "uploads" / f"{stamp}_{image.filename}"
     with open(img_path, "wb") as f:
-        f.write(await image.read())
+        # Stream the spooled upload to disk in 1 MiB chunks, off the event loop
+        await run_in_threadpool(shutil.copyfileobj, image.file, f, 1 << 20)
+    await image.close()
 
     # Detect + crop instances
     pil, instances = detect_instances(state.det, str(img_path))
 
-    # Rank for each instance
-    results = []
-    for inst in instances:
-        emb = state.clip.encode_image(inst["crop"])
-        s_img = cos_sim(emb, state.img_embs)
-        # s_txt = cos_sim(emb, state.txt_embs)
-        # score = alpha_img * s_img + (1 - alpha_img) * s_txt
-        if state.txt_embs is not None:
-            s_txt = cos_sim(emb, state.txt_embs)
-            score = alpha_img * s_img + (1 - alpha_img) * s_txt
-        else:
-            score = s_img
+    # Encode all crops in one CLIP forward, then rank them in one shot
+    # (FAISS index when available, else a single [K, N] GEMM + argpartition).
+    top_idx, top_scores = [], []
+    if instances:
+        embs = state.clip.encode_images_batch([inst.get("crop_array", inst["crop"]) for inst in instances])
+        top_idx, top_scores = rank_catalog(
+            embs, state.img_embs, state.txt_embs, alpha_img, topk, index=state.index
+        )
 
-        idx = np.argsort(-score)[: int(topk)]
+    # Collect recommendations for each instance
+    results = []
+    for inst, idx, scores in zip(instances, top_idx, top_scores):
         recos = []
-        for j in idx:
+        for j, score in zip(idx, scores):
             row = state.catalog_rows[j]
             recos.append({
                 "sku_id": row["sku_id"],
                 "title": row["title"],
                 "brand": row["brand"],
                 "image_url": row["image_path"],
-                "score": float(score[j]),
+                "score": float(score),
             })
 
         results.append({
@@ -1,7 +1,12 @@
 import argparse
 import csv
+import errno
 import gzip
 import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from pathlib import Path
 
 CATALOG_DIR = Path("catalog")
@@ -16,6 +21,9 @@ ABO_LISTINGS_META_DIR = CATALOG_DIR / "abo-listings" / "listings" / "metadata"
 IMAGES_TARGET_DIR = CATALOG_DIR / "images"
 IMAGES_TARGET_DIR.mkdir(parents=True, exist_ok=True)
 
+COPY_WORKERS = 16  # Concurrent image copies (I/O-bound, so threads are enough)
+COPY_CHUNK = 1024  # Listings copied per pool round before their rows are written
+
 
 def choose_text_field(field_list, default=""):
     """Pick English value if available, else first, else default."""
@@ -42,6 +50,26 @@ def load_image_meta():
     return mapping
 
 
+# os.link errors meaning "can't hardlink here" (cross-device, fs without links, ...)
+_LINK_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EACCES, errno.ENOTSUP, errno.EMLINK}
+
+
+def link_or_copy(src, dst):
+    """Hardlink src to dst (same filesystem), else copy in-kernel; skip if dst exists."""
+    if dst.exists():
+        return
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        # Another worker created dst between the check and the link. Never copy over
+        # it: dst may be a hardlink to that worker's source image.
+        return
+    except OSError as e:
+        if e.errno not in _LINK_UNSUPPORTED:
+            raise
+        shutil.copyfile(src, dst)
+
+
 def iter_listings(limit=None):
     """Yield product dicts from all listings_*.json.gz files."""
     count = 0
@@ -57,18 +85,8 @@ def iter_listings(limit=None):
                     return
 
 
-def main(limit=None):
-    # 1) Load existing rows
-    rows = []
-    with open(EXISTING_CATALOG, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            rows.append(row)
-
-    # 2) Image metadata
-    image_meta = load_image_meta()
-
-    # 3) Process ABO listings
+def iter_abo_rows(image_meta, limit=None):
+    """Yield (src_img, dst_img, row) for every ABO listing with a usable main image."""
     for prod in iter_listings(limit=limit):
         item_id = prod.get("item_id")
         domain_name = prod.get("domain_name")
@@ -98,27 +116,42 @@ def main(limit=None):
         # Copy image into catalog/images as <sku_id>.jpg
         dst_img = IMAGES_TARGET_DIR / f"{sku_id}.jpg"
 
-        # If you don't want to overwrite existing, you can guard with:
-        # if dst_img.exists(): continue
-
-        dst_img.parent.mkdir(parents=True, exist_ok=True)
-        dst_img.write_bytes(src_img.read_bytes())
-
-        image_path = f"images/{dst_img.name}"
-
-        rows.append({
+        yield src_img, dst_img, {
             "sku_id": sku_id,
             "title": title,
             "brand": brand,
-            "image_path": image_path,
-        })
+            "image_path": f"images/{dst_img.name}",
+        }
 
-    # 4) Write merged CSV
+
+def main(limit=None):
     fieldnames = ["sku_id", "title", "brand", "image_path"]
-    with open(MERGED_CATALOG, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
+
+    # 1) Image metadata
+    image_meta = load_image_meta()
+    IMAGES_TARGET_DIR.mkdir(parents=True, exist_ok=True)
+
+    # MERGED_CATALOG may be EXISTING_CATALOG, so stream into a temp file and swap it in
+    tmp_catalog = MERGED_CATALOG.with_suffix(".csv.tmp")
+    with open(EXISTING_CATALOG, newline="", encoding="utf-8") as src, \
+            open(tmp_catalog, "w", newline="", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=COPY_WORKERS) as ex:
+        writer = csv.DictWriter(out, fieldnames=fieldnames)
         writer.writeheader()
-        writer.writerows(rows)
+
+        # 2) Stream existing rows
+        for row in csv.DictReader(src):
+            writer.writerow(row)
+
+        # 3) Process ABO listings COPY_CHUNK at a time: copy images in the pool,
+        #    then write their rows. Existing images are left alone, so re-runs
+        #    only copy new listings.
+        listings = iter_abo_rows(image_meta, limit=limit)
+        while batch := list(islice(listings, COPY_CHUNK)):
+            list(ex.map(lambda task: link_or_copy(task[0], task[1]), batch))
+            writer.writerows(row for _, _, row in batch)
+
+    os.replace(tmp_catalog, MERGED_CATALOG)
 
 
 if __name__ == "__main__":
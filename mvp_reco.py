@@ -2,7 +2,7 @@
 import sqlite3
 import os, json, math, csv
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Union
 
 # import cv2
 import numpy as np
@@ -14,12 +14,22 @@ import torchvision.transforms as T
 import open_clip
 from ultralytics import YOLO
 
+try:
+    import faiss     # optional: vector index for top-k search over large catalogs
+except ImportError:
+    faiss = None
+
 # ====== Tunable parameters ======
 MODEL_DET = "yolov8n.pt"   # Lightweight and sufficient
 CONF_THRES = 0.25
 IOU_THRES = 0.45
 TOPK = 1                   # Number of SKUs returned per instance
 ALPHA_IMG = 0.7            # Image similarity weight (image vs text = 0.7 : 0.3)
+CLIP_BATCH = 64            # Max crops per CLIP forward (also sizes the staging buffer)
+CLIP_HALF = True           # Run CLIP in float16 on CUDA (ignored on CPU)
+CLIP_COMPILE = False       # torch.compile encode_image/encode_text (slow first call)
+CATALOG_BATCH = 128        # Images per CLIP forward when building the catalog
+CATALOG_WORKERS = min(8, os.cpu_count() or 1)   # DataLoader workers decoding catalog images
 
 CATALOG_CSV = "catalog/catalog.csv"
 RUNS_DIR = Path("runs")
@@ -35,6 +45,24 @@ def _get_font(size=14):
     except:
         return ImageFont.load_default()
 
+# PIL image or HWC uint8 RGB array -> CHW uint8 tensor (arrays are wrapped, not copied)
+def _to_chw(image: Union[Image.Image, np.ndarray]) -> "torch.Tensor":
+    arr = np.array(image.convert("RGB")) if isinstance(image, Image.Image) else image
+    return torch.from_numpy(arr).permute(2, 0, 1)
+
+# Map-style dataset for DataLoader: decode + preprocess one catalog image per item
+class _ImageFileDataset:
+    def __init__(self, paths: List[str], preprocess):
+        self.paths = paths
+        self.preprocess = preprocess
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, i):
+        with Image.open(self.paths[i]) as img:
+            return self.preprocess(_to_chw(img))
+
 # ====== OpenCLIP Wrapper ======
 class ClipEncoder:
     def __init__(self, model_name="ViT-B-32", pretrained="openai", device=DEVICE):
@@ -44,21 +72,106 @@ class ClipEncoder:
         )
         self.tokenizer = open_clip.get_tokenizer(model_name)
         self.model.eval()
+        self.dtype = torch.float32
+        if CLIP_HALF and str(self.device).startswith("cuda"):
+            self.model = self.model.half()
+            self.dtype = torch.float16
+        if CLIP_COMPILE:
+            self.model.encode_image = torch.compile(self.model.encode_image, mode="max-autotune")
+            self.model.encode_text = torch.compile(self.model.encode_text, mode="max-autotune")
+        self._stage = None   # reusable host staging tensor for batched crops
+
+        # Tensor twin of self.preprocess for CHW uint8 input. Catalog images and query
+        # crops both go through it, so both sides see the same bicubic resampler.
+        size = self.model.visual.image_size
+        side = size if isinstance(size, int) else size[0]
+        mean = getattr(self.model.visual, "image_mean", None) or open_clip.OPENAI_DATASET_MEAN
+        std = getattr(self.model.visual, "image_std", None) or open_clip.OPENAI_DATASET_STD
+        self.tensor_preprocess = torch.nn.Sequential(
+            T.Resize(side, interpolation=T.InterpolationMode.BICUBIC, antialias=True),
+            T.CenterCrop(side),
+            T.ConvertImageDtype(torch.float32),
+            T.Normalize(mean, std),
+        )
+
+    def _staging(self, k: int, shape) -> "torch.Tensor":
+        # Allocated once and reused; pinned on CUDA so the HtoD copy can be async
+        if self._stage is None or tuple(self._stage.shape[1:]) != tuple(shape):
+            pin = str(self.device).startswith("cuda")
+            self._stage = torch.empty((CLIP_BATCH, *shape), dtype=self.dtype, pin_memory=pin)
+        return self._stage[:k]
+
+    @staticmethod
+    def _normalize(feat: "torch.Tensor") -> "torch.Tensor":
+        # Single fused kernel on-device instead of norm() + divide
+        return torch.nn.functional.normalize(feat.float(), dim=-1)
 
     @torch.no_grad()
     def encode_image(self, pil_img: Image.Image) -> np.ndarray:
-        img = self.preprocess(pil_img).unsqueeze(0).to(self.device)
-        feat = self.model.encode_image(img)
-        feat = feat / feat.norm(dim=-1, keepdim=True)
-        return feat.squeeze(0).detach().cpu().numpy()
+        return self.encode_images_batch([pil_img])[0]
+
+    @torch.no_grad()
+    def encode_images_batch(self, images: List[Union[Image.Image, np.ndarray]]) -> np.ndarray:
+        # One forward pass per CLIP_BATCH crops instead of one per crop. Crops (PIL or
+        # HWC uint8 views from detect_instances) are preprocessed on the host straight
+        # into the pinned stage, then moved with a single HtoD copy per chunk.
+        # Features stay on-device; a single .cpu() copy happens at the end.
+        feats, copied = [], None
+        for i in range(0, len(images), CLIP_BATCH):
+            chunk = images[i:i + CLIP_BATCH]
+            if copied is not None:
+                copied.synchronize()   # previous async HtoD copy must finish before reusing the stage
+            for j, p in enumerate(chunk):
+                x = self.tensor_preprocess(_to_chw(p))
+                if j == 0:
+                    stage = self._staging(len(chunk), x.shape)
+                stage[j].copy_(x)
+            imgs = stage.to(self.device, non_blocking=True)
+            if imgs.is_cuda:
+                copied = torch.cuda.Event()
+                copied.record()
+            feats.append(self._normalize(self.model.encode_image(imgs)))
+        return torch.cat(feats).detach().cpu().numpy()   # [K, D]
+
+    @torch.no_grad()
+    def encode_image_files(self, paths: List[str]) -> np.ndarray:
+        # Decode/preprocess in DataLoader workers, encode CATALOG_BATCH images per forward
+        from torch.utils.data import DataLoader
+
+        loader = DataLoader(
+            _ImageFileDataset(paths, self.tensor_preprocess),
+            batch_size=CATALOG_BATCH,
+            num_workers=CATALOG_WORKERS,
+            pin_memory=str(self.device).startswith("cuda"),
+        )
+        out, i = None, 0
+        for imgs in tqdm(loader, desc="Encoding catalog images"):
+            feat = self.model.encode_image(imgs.to(self.device, dtype=self.dtype, non_blocking=True))
+            feat = self._normalize(feat).cpu().numpy()
+            if out is None:
+                out = np.empty((len(paths), feat.shape[1]), dtype=np.float32)
+            out[i:i + len(feat)] = feat
+            i += len(feat)
+        return out   # [N, D]
 
     @torch.no_grad()
     def encode_text(self, text: str) -> np.ndarray:
         toks = self.tokenizer([text]).to(self.device)
-        feat = self.model.encode_text(toks)
-        feat = feat / feat.norm(dim=-1, keepdim=True)
+        feat = self._normalize(self.model.encode_text(toks))
         return feat.squeeze(0).detach().cpu().numpy()
 
+    @torch.no_grad()
+    def encode_texts_batch(self, texts: List[str]) -> np.ndarray:
+        # Tokenize everything in one call, then encode CATALOG_BATCH sequences per forward
+        toks = self.tokenizer(texts).to(self.device)
+        out = None
+        for i in tqdm(range(0, len(texts), CATALOG_BATCH), desc="Encoding catalog texts"):
+            feat = self._normalize(self.model.encode_text(toks[i:i + CATALOG_BATCH])).cpu().numpy()
+            if out is None:
+                out = np.empty((len(texts), feat.shape[1]), dtype=np.float32)
+            out[i:i + len(feat)] = feat
+        return out   # [N, D]
+
 # ====== Catalog construction ======
 def load_catalog(clip: ClipEncoder, csv_path: str) -> Dict[str, Any]:
     with open(csv_path, "r", encoding="utf-8", newline="") as f:
@@ -71,9 +184,9 @@ def load_catalog(clip: ClipEncoder, csv_path: str) -> Dict[str, Any]:
             raise RuntimeError(f"CSV is missing required columns: {', '.join(sorted(missing))}")
         rows_csv = list(reader)
 
-    imgs, img_embs, txts, txt_embs, rows = [], [], [], [], []
+    img_paths, rows = [], []
 
-    for row in tqdm(rows_csv, total=len(rows_csv), desc="Building catalog embeddings"):
+    for row in rows_csv:
         sku = str(row["sku_id"])
         title = str(row["title"])
         brand = str(row["brand"])
@@ -84,15 +197,9 @@ def load_catalog(clip: ClipEncoder, csv_path: str) -> Dict[str, Any]:
             print(f"[WARN] image not found: {p}")
             continue
 
-        pil = Image.open(p).convert("RGB")
-        img_emb = clip.encode_image(pil)
         text = f"{brand} {title}".strip()
-        txt_emb = clip.encode_text(text)
 
-        imgs.append(str(p))
-        img_embs.append(img_emb)
-        txts.append(text)
-        txt_embs.append(txt_emb)
+        img_paths.append(str(p))
         rows.append({
             "sku_id": sku,
             "title": title,
@@ -104,10 +211,14 @@ def load_catalog(clip: ClipEncoder, csv_path: str) -> Dict[str, Any]:
     if not rows:
         raise RuntimeError("Catalog is empty. Please add at least one product with a main image.")
 
+    img_embs = clip.encode_image_files(img_paths)
+    txt_embs = clip.encode_texts_batch([r["text"] for r in rows])
+
+    # Banks are L2-normalized once here so ranking is a plain dot product
     return {
         "rows": rows,
-        "img_embs": np.vstack(img_embs),   # [N, D]
-        "txt_embs": np.vstack(txt_embs),   # [N, D]
+        "img_embs": l2_normalize(img_embs),   # [N, D]
+        "txt_embs": l2_normalize(txt_embs),   # [N, D]
     }
 
 # ====== Database interactions ======
@@ -150,39 +261,107 @@ def save_embeddings_to_db(conn, catalog_rows, img_embs: np.ndarray):
     """, data)
     conn.commit()
 
+# Decode (embedding BLOB, dim) rows into one preallocated [N, D] float32 matrix
+def decode_embeddings(rows) -> np.ndarray:
+    if not rows:
+        return np.empty((0, 0), dtype=np.float32)
+    dim = rows[0]["dim"]
+    out = np.empty((len(rows), dim), dtype=np.float32)
+    for i, r in enumerate(rows):
+        out[i] = np.frombuffer(r["embedding"], dtype=np.float32, count=dim)
+    return out
+
+# ====== Load catalog embeddings from database ======
+def load_embeddings_from_db(conn) -> np.ndarray:
+    # Same sku_id order as load_catalog_from_db
+    rows = conn.execute("""
+        SELECT sku_id, embedding, dim
+        FROM embeddings
+        ORDER BY sku_id
+    """).fetchall()
+    return decode_embeddings(rows)
+
 # Cosine similarity
 def cos_sim(a: np.ndarray, b: np.ndarray) -> np.ndarray:
     # a: [D], b: [N,D] -> [N]
     return (b @ a) / (np.linalg.norm(b, axis=1) * np.linalg.norm(a) + 1e-8)
 
+# Row-wise L2 normalization (done once per catalog, not per query)
+def l2_normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / (np.linalg.norm(x, axis=-1, keepdims=True) + 1e-8)
+
+# Indices of the k highest scores, best first: O(N) partition + O(k log k) sort
+def topk_indices(score: np.ndarray, k: int) -> np.ndarray:
+    k = min(int(k), score.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    part = np.argpartition(-score, k - 1)[:k]
+    return part[np.argsort(-score[part])]
+
+# Inner-product FAISS index over concatenated [img | txt] rows (None without FAISS)
+def build_index(img_embs: np.ndarray, txt_embs: np.ndarray = None):
+    if faiss is None:
+        return None
+    bank = img_embs if txt_embs is None else np.hstack([img_embs, txt_embs])
+    index = faiss.IndexFlatIP(bank.shape[1])
+    index.add(np.ascontiguousarray(bank, dtype=np.float32))
+    return index
+
+# Top-k catalog rows per query embedding -> ([K, k] indices, [K, k] scores), best first
+def rank_catalog(embs: np.ndarray, img_bank: np.ndarray, txt_bank: np.ndarray,
+                 alpha_img: float, k: int, index=None) -> Tuple[np.ndarray, np.ndarray]:
+    k = min(int(k), img_bank.shape[0])
+    if index is not None and k > 0:
+        # <[a*q | (1-a)*q], [img | txt]> == a*(img.q) + (1-a)*(txt.q), so one index serves any alpha
+        q = embs if txt_bank is None else np.hstack([alpha_img * embs, (1 - alpha_img) * embs])
+        scores, idx = index.search(np.ascontiguousarray(q, dtype=np.float32), k)
+        return idx, scores
+    # Banks and CLIP features are unit-norm, so cosine == dot product: [K, N]
+    scores = embs @ img_bank.T
+    if txt_bank is not None:
+        scores = alpha_img * scores + (1 - alpha_img) * (embs @ txt_bank.T)
+    idx = np.stack([topk_indices(s, k) for s in scores])
+    return idx, np.take_along_axis(scores, idx, axis=1)
+
 # ====== Detection + Instance Cropping ======
-def detect_instances(det_model: YOLO, image_path: str) -> Tuple[Image.Image, List[Dict[str, Any]]]:
+def _to_numpy(t) -> np.ndarray:
+    # torch tensors (possibly on GPU) -> host ndarray; array-likes pass through
+    return t.cpu().numpy() if hasattr(t, "cpu") else np.asarray(t)
+
+def detect_instances(det_model: YOLO, image: Union[str, Path, Image.Image]) -> Tuple[Image.Image, List[Dict[str, Any]]]:
+    # Decode exactly once: YOLO gets the in-memory image, never the file path
+    pil = image.convert("RGB") if isinstance(image, Image.Image) else Image.open(image).convert("RGB")
     res = det_model.predict(
-        source=image_path, conf=CONF_THRES, iou=IOU_THRES, device=0 if DEVICE=="cuda" else "cpu", verbose=False
+        source=pil, conf=CONF_THRES, iou=IOU_THRES, device=0 if DEVICE=="cuda" else "cpu", verbose=False
     )[0]
 
     names = det_model.names
-    pil = Image.open(image_path).convert("RGB")
+    rgb = np.array(pil)   # HWC uint8; crop_array entries are views into it
     W, H = pil.size
 
     instances = []
     if res.boxes is not None:
-        for b in res.boxes:
-            x1, y1, x2, y2 = b.xyxy[0].tolist()
-            cls_id = int(b.cls[0].item())
-            conf = float(b.conf[0].item())
+        # One device->host copy per field instead of .tolist()/.item() (a sync) per box
+        xyxy = _to_numpy(res.boxes.xyxy)
+        cls_ids = _to_numpy(res.boxes.cls).astype(int)
+        confs = _to_numpy(res.boxes.conf)
+        for (x1, y1, x2, y2), cls_id, conf in zip(xyxy.tolist(), cls_ids.tolist(), confs.tolist()):
             # Safe cropping
             x1, y1 = max(0, int(x1)), max(0, int(y1))
             x2, y2 = min(W-1, int(x2)), min(H-1, int(y2))
             if x2 <= x1 or y2 <= y1:
                 continue
             crop = pil.crop((x1, y1, x2, y2))
-            instances.append({
+            inst = {
                 "bbox": [x1, y1, x2, y2],
                 "class": names[cls_id],
                 "conf": conf,
                 "crop": crop
-            })
+            }
+            # Zero-copy view for ClipEncoder's tensor preprocessing path
+            inst["crop_array"] = rgb[y1:y2, x1:x2]
+            instances.append(inst)
     return pil, instances
 
 # ====== Visualization and result saving ======
@@ -237,23 +416,20 @@ def recommend_for_image(image_path: str, out_dir: Path):
         return
 
     # 4) For each instance, run retrieval (image→image + image→text)
-    results = []
-    for inst in instances:
-        emb = clip.encode_image(inst["crop"])
-        s_img = cos_sim(emb, img_bank)           # [N]
-        s_txt = cos_sim(emb, txt_bank)           # [N]
-        score = ALPHA_IMG * s_img + (1-ALPHA_IMG) * s_txt
+    embs = clip.encode_images_batch([inst.get("crop_array", inst["crop"]) for inst in instances])
+    top_idx, top_scores = rank_catalog(embs, img_bank, txt_bank, ALPHA_IMG, TOPK)
 
-        idx = np.argsort(-score)[:TOPK]
+    results = []
+    for inst, idx, scores in zip(instances, top_idx, top_scores):
         recos = []
-        for j in idx:
+        for j, score in zip(idx, scores):
             row = catalog["rows"][j]
             recos.append({
                 "sku_id": row["sku_id"],
                 "title": row["title"],
                 "brand": row["brand"],
                 "image_path": row["image_path"],
-                "score": float(score[j])
+                "score": float(score)
             })
 
         results.append({
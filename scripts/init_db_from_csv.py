@@ -11,6 +11,11 @@ def get_conn():
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    # Bulk-load friendly settings: WAL + relaxed fsync, temp tables and a ~200MB page cache in RAM
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-200000")
     return conn
 
 def init_schema(conn):
@@ -38,20 +43,23 @@ def init_schema(conn):
 def load_csv_into_products(conn):
     with open(CSV_PATH, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
-        rows = []
-        for r in reader:
-            rows.append((
+        rows = (
+            (
                 r["sku_id"],
                 r["title"],
                 r.get("brand"),
                 r["image_path"],
                 r.get("source", "csv"),
-            ))
-    conn.executemany("""
-        INSERT OR REPLACE INTO products (sku_id, title, brand, image_path, source)
-        VALUES (?,?,?,?,?)
-    """, rows)
-    conn.commit()
+            )
+            for r in reader
+        )
+        # One explicit transaction for the whole load; rows stream from the CSV
+        conn.execute("BEGIN")
+        conn.executemany("""
+            INSERT OR REPLACE INTO products (sku_id, title, brand, image_path, source)
+            VALUES (?,?,?,?,?)
+        """, rows)
+        conn.commit()
 
 if __name__ == "__main__":
     conn = get_conn()
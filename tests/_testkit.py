@@ -0,0 +1,287 @@
+"""Shared stubs for the unit and integration suites.
+
+Heavy dependencies (torch/torchvision/open_clip/YOLO) are replaced with
+minimal stand-ins so ``mvp_reco`` and ``api`` import without them.
+"""
+
+import io
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+try:
+    import faiss
+except ModuleNotFoundError:
+    faiss = None
+
+
+def _no_grad():
+    def decorator(fn):
+        return fn
+    return decorator
+
+
+def _open_clip_not_available(*args, **kwargs):
+    raise RuntimeError("open_clip is not available in tests.")
+
+
+class _UltralyticsYOLO:
+    def __init__(self, *args, **kwargs):
+        self.names = {}
+
+    def predict(self, *args, **kwargs):
+        raise RuntimeError("YOLO predict() is not available in tests.")
+
+
+# Built once at import; ensure_lightweight_deps only registers them
+_FAKE_TORCH = types.SimpleNamespace(
+    cuda=types.SimpleNamespace(is_available=lambda: False),
+    no_grad=_no_grad,
+)
+_FAKE_TV = types.ModuleType("torchvision")
+_FAKE_TV.transforms = types.SimpleNamespace()
+_FAKE_CLIP = types.SimpleNamespace(
+    create_model_and_transforms=_open_clip_not_available,
+    get_tokenizer=_open_clip_not_available,
+)
+_FAKE_ULTRA = types.SimpleNamespace(YOLO=_UltralyticsYOLO)
+
+
+def ensure_lightweight_deps():
+    """Provide minimal stubs so importing mvp_reco works without heavy deps."""
+    # setdefault only skips modules that are already imported: an installed but
+    # not-yet-imported torch/open_clip/ultralytics is shadowed by the fake on purpose,
+    # so the suite never loads model weights or CUDA
+    sys.modules.setdefault("torch", _FAKE_TORCH)
+    if sys.modules.setdefault("torchvision", _FAKE_TV) is _FAKE_TV:
+        sys.modules.setdefault("torchvision.transforms", _FAKE_TV.transforms)
+    sys.modules.setdefault("open_clip", _FAKE_CLIP)
+    sys.modules.setdefault("ultralytics", _FAKE_ULTRA)
+
+
+def encode_jpeg(size, color) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", size, color=color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=1024)
+def _size_embedding(width: int, height: int) -> np.ndarray:
+    # Shared across calls, so hand out a read-only array
+    emb = np.array([float(width), float(height)], dtype=np.float32)
+    emb.setflags(write=False)
+    return emb
+
+
+@lru_cache(maxsize=1024)
+def _length_embedding(length: int) -> np.ndarray:
+    emb = np.array([float(length), 1.0], dtype=np.float32)
+    emb.setflags(write=False)
+    return emb
+
+
+def _as_pil(image):
+    # api passes detect_instances' crop_array (HWC uint8) when present
+    return Image.fromarray(image) if isinstance(image, np.ndarray) else image
+
+
+class DummyClip:
+    """Minimal stub to avoid loading the real CLIP weights."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def encode_image(self, pil_img: Image.Image) -> np.ndarray:
+        # Encode image into a simple 2D vector based on dimensions.
+        return _size_embedding(pil_img.width, pil_img.height)
+
+    def encode_images_batch(self, images) -> np.ndarray:
+        out = np.empty((len(images), 2), dtype=np.float32)
+        for i, im in enumerate(images):
+            out[i] = self.encode_image(_as_pil(im))
+        return out
+
+    def encode_image_files(self, paths) -> np.ndarray:
+        out = np.empty((len(paths), 2), dtype=np.float32)
+        for i, p in enumerate(paths):
+            with Image.open(p) as img:
+                out[i] = self.encode_image(img)
+        return out
+
+    def encode_text(self, text: str) -> np.ndarray:
+        # Encode text into a stable 2D vector based on length.
+        return _length_embedding(len(text))
+
+    def encode_texts_batch(self, texts) -> np.ndarray:
+        out = np.empty((len(texts), 2), dtype=np.float32)
+        for i, t in enumerate(texts):
+            out[i] = self.encode_text(t)
+        return out
+
+
+class DummyBoxes:
+    def __init__(self, coords, cls_ids, confs):
+        self.xyxy = np.array(coords, dtype=float)
+        self.cls = np.array(cls_ids, dtype=float)
+        self.conf = np.array(confs, dtype=float)
+
+
+class DummyYOLO:
+    """YOLO stand-in whose predict() returns one result holding ``boxes``."""
+
+    def __init__(self, boxes: DummyBoxes, names):
+        self.names = names
+        self._boxes = boxes
+        self.last_source = None
+
+    def predict(self, source, **kwargs):
+        self.last_source = source
+        return [types.SimpleNamespace(boxes=self._boxes)]
+
+
+class FakeFaissIndex:
+    """FAISS-like L2 index: real faiss.IndexFlatL2 when installed, NumPy search otherwise."""
+
+    def __init__(self):
+        self._vecs = None
+        self._vecsT = None
+        self._index = None
+
+    def add(self, vecs: np.ndarray):
+        # No copy when callers already hand over contiguous float32 (the usual case)
+        arr = np.ascontiguousarray(vecs, dtype=np.float32)
+        if arr.ndim == 1:
+            arr = arr.reshape(1, -1)
+        self._vecs = arr
+        self._vecsT = None
+        if faiss is not None:
+            self._index = faiss.IndexFlatL2(arr.shape[1])
+            self._index.add(arr)
+
+    def search(self, queries: np.ndarray, top_k: int):
+        if self._vecs is None:
+            raise RuntimeError("Index empty")
+        q = np.ascontiguousarray(queries, dtype=np.float32)
+        if q.ndim == 1:
+            q = q.reshape(1, -1)
+        if self._index is not None:
+            sq_dist, idx = self._index.search(q, top_k)
+            return -sq_dist, idx  # higher is better (closer)
+        if self._vecsT is None:
+            # (D, N) contiguous copy so the NumPy search is a plain q @ V^T GEMM;
+            # built on first fallback search so faiss-backed indexes never pay for it
+            self._vecsT = np.ascontiguousarray(self._vecs.T)
+        # ||q - v||^2 = ||q||^2 + ||v||^2 - 2 q.v: one GEMM, no [Q, N, D] temporary
+        vn = np.einsum("ij,ij->i", self._vecs, self._vecs)
+        qn = np.einsum("ij,ij->i", q, q)
+        sq_dist = qn[:, None] + vn[None, :] - 2.0 * (q @ self._vecsT)  # [Q, N]
+        sims = -sq_dist  # higher is better (closer)
+        # O(N) partition per query, then sort only the top_k window
+        top_k = min(top_k, sims.shape[1])
+        part = np.argpartition(-sims, top_k - 1, axis=1)[:, :top_k]
+        part_scores = np.take_along_axis(sims, part, axis=1)
+        order = np.argsort(-part_scores, axis=1)
+        idx = np.take_along_axis(part, order, axis=1)
+        top_scores = np.take_along_axis(part_scores, order, axis=1)
+        return top_scores, idx
+
+
+def build_api_stubs(api):
+    """Stand-ins for the api attributes the endpoint tests patch.
+
+    Returns a ``{attr_name: stub}`` mapping; APITestCase adds the
+    subclass's ``detect_instances`` and swaps the whole mapping in and out.
+    """
+
+    class _APIDummyYOLO:
+        def __init__(self, *args, **kwargs):
+            self.names = {0: "det-item"}
+
+        def predict(self, *args, **kwargs):
+            return []
+
+    def fake_draw(pil, results, out_path):
+        # Endpoint tests only need the file to exist; draw_and_save has its own test
+        Path(out_path).touch()
+
+    def fake_try_load_cache():
+        api.state.catalog_rows = [
+            {"sku_id": "sku-a", "title": "Item A", "brand": "Brand A", "image_path": "/static/a.jpg"},
+            {"sku_id": "sku-b", "title": "Item B", "brand": "Brand B", "image_path": "/static/b.jpg"},
+        ]
+        api.state.img_embs = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        api.state.txt_embs = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
+        api.state.embedding_dim = 2
+        return True
+
+    return {
+        "YOLO": _APIDummyYOLO,
+        "ClipEncoder": DummyClip,
+        "draw_and_save": fake_draw,
+        "_try_load_cache": fake_try_load_cache,
+    }
+
+
+class APITestCase(unittest.TestCase):
+    """Endpoint tests against ``api.app`` with build_api_stubs() swapped in.
+
+    Each class gets a throwaway RUNS_DIR and one TestClient; ``api`` and
+    ``api.state`` are restored afterwards. Subclasses set ``fake_detect``
+    (a ``detect_instances`` stand-in) and encode their own upload payloads.
+    """
+
+    fake_detect = None
+
+    @classmethod
+    def setUpClass(cls):
+        ensure_lightweight_deps()
+        try:
+            import api
+            from fastapi.testclient import TestClient
+        except ModuleNotFoundError:
+            raise unittest.SkipTest("FastAPI components not available")
+
+        cls._api = api
+        cls._saved_state = dict(vars(api.state))
+        cls._orig_runs_dir = api.RUNS_DIR
+        cls.tmp_runs_dir = Path(tempfile.mkdtemp())
+        api.RUNS_DIR = cls.tmp_runs_dir
+        (api.RUNS_DIR / "uploads").mkdir()
+
+        stubs = build_api_stubs(api)
+        stubs["detect_instances"] = cls.fake_detect
+        cls._orig_attrs = {name: getattr(api, name) for name in stubs}
+        for name, stub in stubs.items():
+            setattr(api, name, stub)
+
+        # Catalog comes from the stubbed cache even when catalog_path is missing
+        api._try_load_cache()
+
+        # Startup (model + catalog init) runs once for the whole class
+        cls._client_cm = TestClient(api.app)
+        cls.client = cls._client_cm.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        api = cls._api
+        cls._client_cm.__exit__(None, None, None)
+        for name, orig in cls._orig_attrs.items():
+            setattr(api, name, orig)
+        # Drop everything the tests set on the instance in one go
+        vars(api.state).clear()
+        vars(api.state).update(cls._saved_state)
+        api.RUNS_DIR = cls._orig_runs_dir
+        shutil.rmtree(cls.tmp_runs_dir, ignore_errors=True)
+
+    def setUp(self):
+        # Clear files left by the previous test; the directories are reused
+        for p in self.tmp_runs_dir.rglob("*"):
+            if p.is_file():
+                p.unlink()
@@ -1,148 +1,55 @@
 import csv
-import importlib
 import importlib.util
-import io
 import shutil
+import sqlite3
 import sys
 import tempfile
-import types
+import unittest
+from unittest import mock
 from pathlib import Path
 
 # This unified unittest runner covers:
 #   1. mvp_reco.load_catalog: verifies CSV parsing + embedding generation with a DummyClip.
-#   2. mvp_reco.cos_sim: checks cosine similarity math on simple vectors.
+#   2. mvp_reco.cos_sim / topk_indices / rank_catalog: similarity math, top-k ordering, FAISS parity.
 #   3. Image detection + cropping utilities (detect_instances + draw/save).
-#   4. Catalog database helpers (load_catalog_from_db + save_embeddings_to_db).
-#   5. data_merge.choose_text_field for language handling.
-#   6. FastAPI request/response handling (health + recommend endpoints).
+#   4. Catalog database helpers (save_embeddings_to_db + load_embeddings_from_db).
+#   5. data_merge.choose_text_field for language handling + link_or_copy.
+#   6. FastAPI request/response handling (health + recommend endpoints, embedding cache).
 # Heavy dependencies (torch/torchvision/open_clip/YOLO) are stubbed so the tests stay lightweight.
 
 import numpy as np
 from PIL import Image
 
-try:
-    from fastapi.testclient import TestClient
-except ModuleNotFoundError:
-    TestClient = None
-
-
-def _load_std_unittest():
-    project_dir = str(Path(__file__).resolve().parent)
-    removed = False
-    if project_dir in sys.path:
-        sys.path.remove(project_dir)
-        removed = True
-    try:
-        module = importlib.import_module("unittest")
-    finally:
-        if removed:
-            sys.path.insert(0, project_dir)
-    return module
-
-
-unittest = _load_std_unittest()
-
-
-def _ensure_lightweight_deps():
-    """Provide minimal stubs so importing mvp_reco works without heavy deps."""
-    if "torch" not in sys.modules:
-        def _no_grad():
-            def decorator(fn):
-                return fn
-            return decorator
-
-        fake_torch = types.SimpleNamespace(
-            cuda=types.SimpleNamespace(is_available=lambda: False),
-            no_grad=_no_grad,
-        )
-        sys.modules["torch"] = fake_torch
-
-    if "torchvision" not in sys.modules:
-        fake_tv = types.ModuleType("torchvision")
-        fake_tv.transforms = types.SimpleNamespace()
-        sys.modules["torchvision"] = fake_tv
-        sys.modules["torchvision.transforms"] = fake_tv.transforms
-
-    if "open_clip" not in sys.modules:
-        def _not_available(*args, **kwargs):
-            raise RuntimeError("open_clip is not available in unit tests.")
-
-        fake_clip = types.SimpleNamespace(
-            create_model_and_transforms=_not_available,
-            get_tokenizer=_not_available,
-        )
-        sys.modules["open_clip"] = fake_clip
-
-    if "ultralytics" not in sys.modules:
-        class _DummyYOLO:
-            def __init__(self, *args, **kwargs):
-                self.names = {}
-
-            def predict(self, *args, **kwargs):
-                raise RuntimeError("YOLO predict() is not available in unit tests.")
-
-        fake_ultra = types.SimpleNamespace(YOLO=_DummyYOLO)
-        sys.modules["ultralytics"] = fake_ultra
-
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from _testkit import (  # noqa: E402
+    APITestCase,
+    DummyBoxes,
+    DummyClip,
+    DummyYOLO,
+    encode_jpeg,
+    ensure_lightweight_deps,
+)
 
-_ensure_lightweight_deps()
+ensure_lightweight_deps()
 
-import mvp_reco
-from data_merge import choose_text_field
+import mvp_reco  # noqa: E402
+from data_merge import choose_text_field, link_or_copy  # noqa: E402
 
 try:
-    import api
+    import api  # noqa: E402
 except ModuleNotFoundError:
     api = None
 
-init_db = None
-_init_db_path = Path(__file__).resolve().parent / "scripts" / "init_db_from_csv.py"
-if _init_db_path.exists():
-    spec = importlib.util.spec_from_file_location("init_db_from_csv_module", _init_db_path)
-    if spec and spec.loader:
-        init_db = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(init_db)
-
-
-class DummyClip:
-    """Minimal stub to avoid loading the real CLIP weights."""
-
-    def encode_image(self, pil_img: Image.Image) -> np.ndarray:
-        # Encode image into a simple 2D vector based on dimensions.
-        return np.array([float(pil_img.width), float(pil_img.height)], dtype=np.float32)
-
-    def encode_text(self, text: str) -> np.ndarray:
-        # Encode text into a stable 2D vector based on length.
-        return np.array([float(len(text)), 1.0], dtype=np.float32)
-
 
 class DetectionAndCroppingTests(unittest.TestCase):
     def test_detect_instances_converts_yolo_boxes(self):
-        class _Scalar:
-            def __init__(self, value):
-                self._value = value
-
-            def item(self):
-                return self._value
-
-        class _DummyBox:
-            def __init__(self, coords, cls_id, conf):
-                self.xyxy = [np.array(coords, dtype=float)]
-                self.cls = [_Scalar(cls_id)]
-                self.conf = [_Scalar(conf)]
-
-        class _DummyYOLO:
-            def __init__(self):
-                self.names = {0: "chair"}
-
-            def predict(self, source, **kwargs):
-                return [types.SimpleNamespace(boxes=[_DummyBox([1.2, 2.7, 8.9, 9.1], 0, 0.95)])]
+        det = DummyYOLO(DummyBoxes([[1.2, 2.7, 8.9, 9.1]], [0], [0.95]), {0: "chair"})
 
         with tempfile.TemporaryDirectory() as tmpdir:
             img_path = Path(tmpdir) / "input.jpg"
-            Image.new("RGB", (10, 10), color=(0, 0, 0)).save(img_path)
+            Image.new("L", (10, 10)).save(img_path)
 
-            pil, instances = mvp_reco.detect_instances(_DummyYOLO(), str(img_path))
+            pil, instances = mvp_reco.detect_instances(det, str(img_path))
 
         self.assertEqual(pil.size, (10, 10))
         self.assertEqual(len(instances), 1)
@@ -152,6 +59,20 @@ class DetectionAndCroppingTests(unittest.TestCase):
         self.assertAlmostEqual(inst["conf"], 0.95)
         self.assertEqual(inst["crop"].size, (7, 7))
 
+    def test_detect_instances_decodes_image_once(self):
+        image = Image.new("RGB", (8, 6), color=(0, 0, 255))
+        det = DummyYOLO(DummyBoxes([[1.0, 1.0, 5.0, 4.0]], [0], [0.8]), {0: "cup"})
+
+        pil, instances = mvp_reco.detect_instances(det, image)
+
+        self.assertIsInstance(det.last_source, Image.Image)  # YOLO never re-reads a file
+        self.assertEqual(pil.size, (8, 6))
+        self.assertEqual(len(instances), 1)
+        self.assertEqual(instances[0]["crop"].size, (4, 3))
+        crop_array = instances[0]["crop_array"]
+        self.assertEqual(crop_array.shape, (3, 4, 3))
+        self.assertEqual(crop_array[0, 0].tolist(), [0, 0, 255])
+
     def test_draw_and_save_outputs_visualization(self):
         pil = Image.new("RGB", (8, 8), color=(255, 255, 255))
         results = [{
@@ -173,29 +94,34 @@ class DetectionAndCroppingTests(unittest.TestCase):
 
 
 class LoadCatalogTests(unittest.TestCase):
-    def test_load_catalog_builds_embeddings_from_csv(self):
-        clip = DummyClip()
-        with tempfile.TemporaryDirectory() as tmpdir:
-            tmp_path = Path(tmpdir)
-            img_dir = tmp_path / "images"
-            img_dir.mkdir()
-            img_path = img_dir / "sample.jpg"
-            Image.new("RGB", (10, 20), color=(255, 0, 0)).save(img_path)
+    @classmethod
+    def setUpClass(cls):
+        # One read-only catalog tree (image + CSV) shared by every test
+        cls._catalog_dir = Path(tempfile.mkdtemp())
+        img_dir = cls._catalog_dir / "images"
+        img_dir.mkdir()
+        img_path = img_dir / "sample.jpg"
+        Image.new("L", (10, 20)).save(img_path)
+
+        cls.catalog_path = cls._catalog_dir / "catalog.csv"
+        with open(cls.catalog_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=["sku_id", "title", "brand", "image_path"])
+            writer.writeheader()
+            writer.writerow(
+                {
+                    "sku_id": "sku-1",
+                    "title": "Demo Product",
+                    "brand": "Demo Brand",
+                    "image_path": f"images/{img_path.name}",
+                }
+            )
 
-            csv_path = tmp_path / "catalog.csv"
-            with open(csv_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=["sku_id", "title", "brand", "image_path"])
-                writer.writeheader()
-                writer.writerow(
-                    {
-                        "sku_id": "sku-1",
-                        "title": "Demo Product",
-                        "brand": "Demo Brand",
-                        "image_path": f"images/{img_path.name}",
-                    }
-                )
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls._catalog_dir, ignore_errors=True)
 
-            catalog = mvp_reco.load_catalog(clip, str(csv_path))
+    def test_load_catalog_builds_embeddings_from_csv(self):
+        catalog = mvp_reco.load_catalog(DummyClip(), str(self.catalog_path))
 
         self.assertEqual(len(catalog["rows"]), 1)
         self.assertEqual(catalog["rows"][0]["sku_id"], "sku-1")
@@ -214,8 +140,73 @@ class CosSimTests(unittest.TestCase):
         self.assertAlmostEqual(sims[1], 1 / np.sqrt(2), places=6)
 
 
+class TopKTests(unittest.TestCase):
+    def test_topk_indices_returns_best_first(self):
+        score = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+
+        self.assertEqual(mvp_reco.topk_indices(score, 2).tolist(), [1, 3])
+        self.assertEqual(mvp_reco.topk_indices(score, 10).tolist(), [1, 3, 2, 0])
+        self.assertEqual(len(mvp_reco.topk_indices(score, 0)), 0)
+
+
+class RankCatalogTests(unittest.TestCase):
+    def setUp(self):
+        self.img_bank = mvp_reco.l2_normalize(np.array([[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]]))
+        self.txt_bank = mvp_reco.l2_normalize(np.array([[0.0, 1.0], [1.0, 0.0], [1.0, 1.0]]))
+        self.embs = mvp_reco.l2_normalize(np.array([[1.0, 0.2], [0.1, 1.0]]))
+
+    def test_rank_catalog_blends_image_and_text_scores(self):
+        idx, scores = mvp_reco.rank_catalog(self.embs, self.img_bank, self.txt_bank, 0.7, 2)
+
+        expected = 0.7 * (self.embs @ self.img_bank.T) + 0.3 * (self.embs @ self.txt_bank.T)
+        self.assertEqual(idx.shape, (2, 2))
+        self.assertEqual(idx[:, 0].tolist(), np.argmax(expected, axis=1).tolist())
+        self.assertTrue(np.allclose(scores, np.take_along_axis(expected, idx, axis=1)))
+
+    def test_faiss_index_matches_numpy_ranking(self):
+        index = mvp_reco.build_index(self.img_bank, self.txt_bank)
+        if index is None:
+            self.skipTest("faiss not installed")
+
+        for alpha in (0.0, 0.4, 1.0):
+            idx_np, scores_np = mvp_reco.rank_catalog(self.embs, self.img_bank, self.txt_bank, alpha, 3)
+            idx_fs, scores_fs = mvp_reco.rank_catalog(
+                self.embs, self.img_bank, self.txt_bank, alpha, 3, index=index
+            )
+            self.assertEqual(idx_fs.tolist(), idx_np.tolist())
+            self.assertTrue(np.allclose(scores_fs, scores_np, atol=1e-5))
+
+
 class CatalogDatabaseTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Load the script only when these tests actually run
+        cls.init_db = None
+        init_db_path = Path(__file__).resolve().parent.parent / "scripts" / "init_db_from_csv.py"
+        if init_db_path.exists():
+            spec = importlib.util.spec_from_file_location("init_db_from_csv_module", init_db_path)
+            if spec and spec.loader:
+                cls.init_db = importlib.util.module_from_spec(spec)
+                spec.loader.exec_module(cls.init_db)
+
+    def test_embeddings_round_trip_through_db(self):
+        conn = sqlite3.connect(":memory:")
+        conn.row_factory = sqlite3.Row
+        conn.execute("CREATE TABLE embeddings (sku_id TEXT PRIMARY KEY, embedding BLOB NOT NULL, dim INTEGER NOT NULL)")
+        try:
+            rows = [{"sku_id": "sku-b"}, {"sku_id": "sku-a"}]
+            embs = np.array([[0.0, 1.0, 0.0], [1.0, 0.0, 0.0]], dtype=np.float32)
+            mvp_reco.save_embeddings_to_db(conn, rows, embs)
+
+            loaded = mvp_reco.load_embeddings_from_db(conn)
+        finally:
+            conn.close()
+
+        self.assertEqual(loaded.dtype, np.float32)
+        self.assertTrue(np.array_equal(loaded, embs[::-1]))  # ordered by sku_id
+
     def test_init_db_script_loads_csv(self):
+        init_db = self.init_db
         if init_db is None:
             self.skipTest("init_db_from_csv module not available")
         original_db_path = init_db.DB_PATH
@@ -253,6 +244,69 @@ class CatalogDatabaseTests(unittest.TestCase):
         init_db.CSV_PATH = original_csv_path
 
 
+class EmbeddingCacheTests(unittest.TestCase):
+    def _round_trip(self, cache_dtype):
+        if api is None:
+            self.skipTest("FastAPI components not available")
+        original_emb_dir, original_dtype = api.EMB_DIR, api.EMB_CACHE_DTYPE
+        saved_state = dict(vars(api.state))
+        rows = [{"sku_id": "sku-1"}, {"sku_id": "sku-2"}]
+        img_embs = mvp_reco.l2_normalize(np.array([[3.0, 4.0], [1.0, 0.0]]))
+        txt_embs = mvp_reco.l2_normalize(np.array([[0.0, 1.0], [1.0, 1.0]]))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            api.EMB_DIR = Path(tmpdir)
+            api.EMB_CACHE_DTYPE = np.dtype(cache_dtype)
+            try:
+                api._save_cache(rows, img_embs, txt_embs)
+                self.assertTrue(api._try_load_cache())
+                self.assertEqual(api.state.img_embs.dtype, np.float32)
+                self.assertTrue(np.allclose(api.state.img_embs, img_embs, atol=1e-3))
+                self.assertTrue(np.allclose(api.state.txt_embs, txt_embs, atol=1e-3))
+                self.assertEqual([r["sku_id"] for r in api.state.catalog_rows], ["sku-1", "sku-2"])
+                return type(api.state.img_embs), type(api.state.txt_embs)
+            finally:
+                api.EMB_DIR, api.EMB_CACHE_DTYPE = original_emb_dir, original_dtype
+                vars(api.state).clear()
+                vars(api.state).update(saved_state)
+
+    def test_float16_cache_is_upcast_to_float32(self):
+        img_type, txt_type = self._round_trip("float16")
+        self.assertIs(img_type, np.ndarray)  # private float32 copy, not a file mapping
+        self.assertIs(txt_type, np.ndarray)
+
+    def test_float32_cache_stays_memory_mapped(self):
+        img_type, txt_type = self._round_trip("float32")
+        self.assertTrue(issubclass(img_type, np.memmap))
+        self.assertTrue(issubclass(txt_type, np.memmap))
+
+    def test_db_load_drops_stale_text_bank(self):
+        if api is None:
+            self.skipTest("FastAPI components not available")
+        conn = sqlite3.connect(":memory:")
+        conn.row_factory = sqlite3.Row
+        conn.execute("CREATE TABLE products (sku_id TEXT PRIMARY KEY, title TEXT, brand TEXT, image_path TEXT)")
+        conn.execute("CREATE TABLE embeddings (sku_id TEXT PRIMARY KEY, embedding BLOB NOT NULL, dim INTEGER NOT NULL)")
+        rows = [{"sku_id": "sku-a"}, {"sku_id": "sku-b"}]
+        conn.executemany("INSERT INTO products VALUES (?, 'T', 'B', 'p.jpg')", [(r["sku_id"],) for r in rows])
+        mvp_reco.save_embeddings_to_db(conn, rows, np.eye(2, dtype=np.float32))
+
+        original_get_db, original_use_faiss = api.get_db, api.USE_FAISS
+        saved_state = dict(vars(api.state))
+        api.get_db = lambda: conn
+        api.USE_FAISS = True
+        try:
+            # Text bank from an earlier, larger catalog must not reach build_index
+            api.state.txt_embs = np.zeros((3, 2), dtype=np.float32)
+            result = api._build_catalog(None, Path("unused.csv"))
+            self.assertEqual(result["status"], "loaded_from_db")
+            self.assertIsNone(api.state.txt_embs)
+            self.assertEqual(api.state.img_embs.shape, (2, 2))
+        finally:
+            api.get_db, api.USE_FAISS = original_get_db, original_use_faiss
+            vars(api.state).clear()
+            vars(api.state).update(saved_state)
+
+
 class ChooseTextFieldTests(unittest.TestCase):
     def test_prefers_english_value(self):
         field_list = [
@@ -272,110 +326,85 @@ class ChooseTextFieldTests(unittest.TestCase):
         self.assertEqual(choose_text_field([], default="Missing"), "Missing")
 
 
-class FrontendAPITests(unittest.TestCase):
-    def setUp(self):
-        if api is None or TestClient is None:
-            self.skipTest("FastAPI components not available")
-        self.orig_detect = api.detect_instances
-        self.orig_draw = api.draw_and_save
-        self.orig_try = api._try_load_cache
-        self.orig_yolo = api.YOLO
-        self.orig_clip = api.ClipEncoder
-        self.orig_runs_dir = api.RUNS_DIR
-        self.tmp_runs_dir = Path(tempfile.mkdtemp())
-        api.RUNS_DIR = self.tmp_runs_dir
-        (api.RUNS_DIR / "uploads").mkdir(parents=True, exist_ok=True)
-
-        class _APIDummyYOLO:
-            def __init__(self, *args, **kwargs):
-                self.names = {0: "det-item"}
-
-            def predict(self, *args, **kwargs):
-                return []
-
-        class _APIDummyClip:
-            def __init__(self, *args, **kwargs):
-                pass
-
-            def encode_image(self, pil_img):
-                return np.array([1.0, 0.0], dtype=np.float32)
-
-        def fake_detect_instances(det_model, image_path):
-            pil = Image.new("RGB", (6, 6), color=(0, 0, 0))
-            crop = pil.crop((0, 0, 4, 4))
-            return pil, [{
-                "bbox": [0, 0, 4, 4],
-                "class": "det-item",
-                "conf": 0.91,
-                "crop": crop,
-            }]
-
-        def fake_draw(pil, results, out_path):
-            pil.save(out_path)
-
-        def fake_try_load_cache():
-            api.state.catalog_rows = [
-                {"sku_id": "sku-a", "title": "Item A", "brand": "Brand A", "image_path": "/static/a.jpg"},
-                {"sku_id": "sku-b", "title": "Item B", "brand": "Brand B", "image_path": "/static/b.jpg"},
-            ]
-            api.state.img_embs = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
-            api.state.txt_embs = np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)
-            api.state.embedding_dim = 2
-            return True
-
-        api.YOLO = _APIDummyYOLO
-        api.ClipEncoder = _APIDummyClip
-        api.detect_instances = fake_detect_instances
-        api.draw_and_save = fake_draw
-        api._try_load_cache = fake_try_load_cache
-
-    def tearDown(self):
-        api.detect_instances = self.orig_detect
-        api.draw_and_save = self.orig_draw
-        api._try_load_cache = self.orig_try
-        api.YOLO = self.orig_yolo
-        api.ClipEncoder = self.orig_clip
-        api.state.det = None
-        api.state.clip = None
-        api.state.catalog_rows = []
-        api.state.img_embs = None
-        api.state.txt_embs = None
-        api.RUNS_DIR = self.orig_runs_dir
-        shutil.rmtree(self.tmp_runs_dir, ignore_errors=True)
-
-    def _make_client(self):
-        return TestClient(api.app)
+class LinkOrCopyTests(unittest.TestCase):
+    def test_links_new_file_and_keeps_existing(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            src = tmpdir / "src.jpg"
+            src.write_bytes(b"new")
+            dst = tmpdir / "dst.jpg"
+
+            link_or_copy(src, dst)
+            self.assertEqual(dst.read_bytes(), b"new")
+
+            existing = tmpdir / "existing.jpg"
+            existing.write_bytes(b"old")
+            link_or_copy(src, existing)
+            self.assertEqual(existing.read_bytes(), b"old")
+
+    def test_concurrent_link_never_overwrites_first_source(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = Path(tmpdir)
+            first, second = tmpdir / "first.jpg", tmpdir / "second.jpg"
+            first.write_bytes(b"first")
+            second.write_bytes(b"second")
+            dst = tmpdir / "dst.jpg"
+
+            link_or_copy(first, dst)
+            # Simulate losing the race: the exists() check ran before dst was created
+            with mock.patch.object(Path, "exists", return_value=False):
+                link_or_copy(second, dst)
+                link_or_copy(first, dst)  # same source again: no SameFileError
+
+            self.assertEqual(first.read_bytes(), b"first")
+            self.assertEqual(second.read_bytes(), b"second")
+            self.assertEqual(dst.read_bytes(), b"first")
+
+
+def _fake_detect_blank(det_model, image_path):
+    pil = Image.new("RGB", (6, 6), color=(0, 0, 0))
+    crop = pil.crop((0, 0, 4, 4))
+    return pil, [{
+        "bbox": [0, 0, 4, 4],
+        "class": "det-item",
+        "conf": 0.91,
+        "crop": crop,
+    }]
+
+
+class FrontendAPITests(APITestCase):
+    fake_detect = staticmethod(_fake_detect_blank)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._jpeg_red = encode_jpeg((4, 4), (255, 0, 0))
 
     def test_health_endpoint_reports_ready(self):
-        with self._make_client() as client:
-            resp = client.get("/health")
-            self.assertEqual(resp.status_code, 200)
-            data = resp.json()
-            self.assertTrue(data["ok"])
-            self.assertTrue(data["models_ready"])
-            self.assertTrue(data["catalog_ready"])
+        resp = self.client.get("/health")
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertTrue(data["ok"])
+        self.assertTrue(data["models_ready"])
+        self.assertTrue(data["catalog_ready"])
 
     def test_recommend_endpoint_returns_instances(self):
-        with self._make_client() as client:
-            img_bytes = io.BytesIO()
-            Image.new("RGB", (4, 4), color=(255, 0, 0)).save(img_bytes, format="JPEG")
-            img_bytes.seek(0)
-            files = {
-                "image": ("test.jpg", img_bytes.getvalue(), "image/jpeg")
-            }
-            resp = client.post(
-                "/recommend",
-                data={"topk": "1", "alpha_img": "0.5", "return_vis": "false"},
-                files=files,
-            )
-            self.assertEqual(resp.status_code, 200, resp.text)
-            data = resp.json()
-            self.assertIn("instances", data)
-            self.assertEqual(len(data["instances"]), 1)
-            inst = data["instances"][0]
-            self.assertEqual(inst["bbox"], [0, 0, 4, 4])
-            self.assertEqual(len(inst["top_k"]), 1)
-            self.assertIsNotNone(data["image_url"])
+        files = {
+            "image": ("test.jpg", self._jpeg_red, "image/jpeg")
+        }
+        resp = self.client.post(
+            "/recommend",
+            data={"topk": "1", "alpha_img": "0.5", "return_vis": "false"},
+            files=files,
+        )
+        self.assertEqual(resp.status_code, 200, resp.text)
+        data = resp.json()
+        self.assertIn("instances", data)
+        self.assertEqual(len(data["instances"]), 1)
+        inst = data["instances"][0]
+        self.assertEqual(inst["bbox"], [0, 0, 4, 4])
+        self.assertEqual(len(inst["top_k"]), 1)
+        self.assertIsNotNone(data["image_url"])
 
 
 if __name__ == "__main__":